@@ -1,9 +1,10 @@
 from __future__ import annotations
 import os, json
 from pathlib import Path
-from fastapi import FastAPI
+from typing import Literal
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse, StreamingResponse
+from fastapi.responses import FileResponse, HTMLResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 import pandas as pd
@@ -19,12 +20,15 @@ from src.baselines import make_holdout_masks, wmae
 from src.forecasting import recursive_rf_forecast
 from src.models_sarimax import forecast_sarimax_for_series
 from src.models_prophet import forecast_prophet_for_series
+from src.profiling import get_profiler
 
 APP_DIR = Path(__file__).resolve().parent
 BASE_DIR = APP_DIR.parent
 DATA_DIR = BASE_DIR / "data"
 ART_DIR = BASE_DIR / "artifacts"
 UI_DIR = BASE_DIR / "ui"
+PROFILE_DIR = ART_DIR / "profiles"
+PROFILE_KEEP = int(os.environ.get("PROFILE_KEEP", "50"))  # newest profiles retained in PROFILE_DIR
 
 app = FastAPI(title="Walmart Forecast API", version="1.0.0")
 app.add_middleware(
@@ -43,6 +47,7 @@ except Exception as e:
 
 class TrainRequest(BaseModel):
     force: bool = True
+    backend: Literal["rf", "hgb"] = "rf"
 
 class ForecastRequest(BaseModel):
     store: int
@@ -51,6 +56,22 @@ class ForecastRequest(BaseModel):
     mode: str = "global_rf"  # global_rf | seasonal_naive | sarimax | prophet
     start_date: str|None = None
 
+def profiler_for(request: Request, name: str):
+    """Profiling is opt-in per request via ``?profile=1`` or an ``X-Profile: 1`` header."""
+    flag = request.query_params.get("profile") or request.headers.get("x-profile") or ""
+    return get_profiler(flag.lower() in ("1", "true", "yes"), name)
+
+def with_profile(payload, prof):
+    if not prof.enabled:
+        return payload
+    saved = prof.save(PROFILE_DIR, keep=PROFILE_KEEP)
+    saved["download"] = [f"/profiles/{f}" for f in saved["files"]]
+    if isinstance(payload, dict):
+        payload["profile"] = saved
+    else:
+        payload.headers["X-Profile-Id"] = saved["id"]
+    return payload
+
 @app.get("/", response_class=HTMLResponse)
 def root():
     index_html = (UI_DIR / "index.html").read_text(encoding="utf-8")
@@ -59,13 +80,18 @@ def root():
 @app.get("/health")
 def health():
     art = [p.name for p in ART_DIR.glob("*.joblib")]
-    return {"ok": True, "data_loaded": DF is not None, "artifacts": art}
+    meta_path = ART_DIR / "model_meta.json"
+    backend = json.loads(meta_path.read_text(encoding="utf-8")).get("backend") if meta_path.exists() else None
+    return {"ok": True, "data_loaded": DF is not None, "artifacts": art, "backend": backend}
 
 @app.post("/train")
-def train(req: TrainRequest):
+def train(req: TrainRequest, request: Request):
     from src.train import main as train_main
-    train_main(DATA_DIR, ART_DIR)
-    return {"status": "trained"}
+    prof = profiler_for(request, "train")
+    with prof:
+        train_main(DATA_DIR, ART_DIR, backend=req.backend, refresh=not req.force, profiler=prof)
+    meta = json.loads((ART_DIR / "model_meta.json").read_text(encoding="utf-8"))
+    return with_profile({"status": "trained", "backend": req.backend, "mode": meta["mode"], "version": meta["version"]}, prof)
 
 def load_rf():
     model_path = ART_DIR / "rf_model.joblib"
@@ -84,19 +110,36 @@ def list_series(top:int=50):
                 .sort_values("avg", ascending=False).head(top))
     return {"count": int(len(sstats)), "series": sstats.to_dict(orient="records")}
 
+@app.get("/profiles/{name}")
+def get_profile(name: str):
+    """Download a saved ``.prof`` (cProfile) or ``.json`` (stage timeline) profile artifact."""
+    path = (PROFILE_DIR / name).resolve()
+    if path.parent != PROFILE_DIR.resolve() or path.suffix not in (".prof", ".json") or not path.exists():
+        return {"error": f"No profile named {name}"}
+    return FileResponse(path, filename=name)
+
 @app.get("/leaderboard")
-def get_leaderboard():
+def get_leaderboard(request: Request):
     try:
         from src.evaluate import leaderboard
-        path, lb = leaderboard(DATA_DIR, ART_DIR, holdout_weeks=8, topN_series=10)
-        return {"path": str(path), "rows": lb.to_dict(orient="records")}
+        prof = profiler_for(request, "leaderboard")
+        with prof:
+            path, lb = leaderboard(DATA_DIR, ART_DIR, holdout_weeks=8, topN_series=10, profiler=prof)
+        return with_profile({"path": str(path), "rows": lb.to_dict(orient="records")}, prof)
     except Exception as e:
         return {"error": str(e)}
 
 @app.post("/forecast")
-def forecast(req: ForecastRequest):
+def forecast(req: ForecastRequest, request: Request):
+    prof = profiler_for(request, "forecast")
+    with prof:
+        out = _forecast(req, prof)
+    return with_profile(out, prof)
+
+def _forecast(req: ForecastRequest, prof):
     assert DF is not None, "Data not loaded; place CSVs in data/ and restart."
-    sub = DF[(DF["Store"]==req.store) & (DF["Dept"]==req.dept)]
+    with prof.stage("series_select"):
+        sub = DF[(DF["Store"]==req.store) & (DF["Dept"]==req.dept)]
     if sub.empty:
         return {"error": f"No data for Store {req.store}, Dept {req.dept}"}
 
@@ -111,35 +154,47 @@ def forecast(req: ForecastRequest):
         return {"mode": "seasonal_naive", "dates": dates.astype(str).tolist(), "yhat": yhat}
 
     if req.mode == "sarimax":
-        yhat, err = forecast_sarimax_for_series(DF, req.store, req.dept, horizon=req.horizon)
+        with prof.stage("predict_loop"):
+            yhat, err = forecast_sarimax_for_series(DF, req.store, req.dept, horizon=req.horizon)
         if err: return {"error": err}
         dates = pd.date_range(sub["Date"].max() + pd.Timedelta(weeks=1), periods=req.horizon, freq="W")
         return {"mode": "sarimax", "dates": dates.astype(str).tolist(), "yhat": yhat}
 
     if req.mode == "prophet":
-        rows, err = forecast_prophet_for_series(DF, req.store, req.dept, horizon=req.horizon)
+        with prof.stage("predict_loop"):
+            rows, err = forecast_prophet_for_series(DF, req.store, req.dept, horizon=req.horizon)
         if err: return {"error": err}
         return {"mode": "prophet", "rows": rows}
 
-    rf, feature_cols = load_rf()
+    with prof.stage("model_load"):
+        rf, feature_cols = load_rf()
     if rf is None:
         return {"error": "RF model not trained. Call /train first."}
 
-    mod, X, y, feats = build_features(DF)
-    X = X.reindex(columns=feature_cols, fill_value=0)
-    series_mod = mod[(mod["Store"]==req.store) & (mod["Dept"]==req.dept)].copy().sort_values("Date")
+    with prof.stage("feature_build"):
+        mod, X, y, feats = build_features(DF)
+        X = X.reindex(columns=feature_cols, fill_value=0)
+        series_mod = mod[(mod["Store"]==req.store) & (mod["Dept"]==req.dept)].copy().sort_values("Date")
     if series_mod.empty:
         return {"error": "Series has no rows after feature prep"}
     future_dates = pd.date_range(series_mod["Date"].max() + pd.Timedelta(weeks=1), periods=req.horizon, freq="W")
-    dates, preds = recursive_rf_forecast(series_mod, feature_cols, rf, req.horizon)
+    with prof.stage("predict_loop"):
+        dates, preds = recursive_rf_forecast(series_mod, feature_cols, rf, req.horizon)
     return {"mode": "global_rf", "dates": dates, "yhat": preds}
 
 
 @app.post("/plot")
-def plot(req: ForecastRequest):
+def plot(req: ForecastRequest, request: Request):
     """Return a PNG chart for the requested forecast mode."""
+    prof = profiler_for(request, "plot")
+    with prof:
+        out = _plot(req, prof)
+    return with_profile(out, prof)
+
+def _plot(req: ForecastRequest, prof):
     assert DF is not None, "Data not loaded; place CSVs in data/ and restart."
-    sub = DF[(DF["Store"]==req.store) & (DF["Dept"]==req.dept)].copy().sort_values("Date")
+    with prof.stage("series_select"):
+        sub = DF[(DF["Store"]==req.store) & (DF["Dept"]==req.dept)].copy().sort_values("Date")
     if sub.empty:
         return {"error": f"No data for Store {req.store}, Dept {req.dept}"}
 
@@ -163,7 +218,8 @@ def plot(req: ForecastRequest):
         ax.plot(dates, yhat, label="Seasonal Naive", linestyle="--")
 
     elif req.mode == "sarimax":
-        yhat, err = forecast_sarimax_for_series(DF, req.store, req.dept, horizon=req.horizon)
+        with prof.stage("predict_loop"):
+            yhat, err = forecast_sarimax_for_series(DF, req.store, req.dept, horizon=req.horizon)
         dates = pd.date_range(sub["Date"].max() + pd.Timedelta(weeks=1), periods=req.horizon, freq="W")
         if err or yhat is None:
             fig.suptitle(f"SARIMAX error: {err}", color="orange")
@@ -171,7 +227,8 @@ def plot(req: ForecastRequest):
             ax.plot(dates, yhat, label="SARIMAX", linestyle="--")
 
     elif req.mode == "prophet":
-        rows, err = forecast_prophet_for_series(DF, req.store, req.dept, horizon=req.horizon)
+        with prof.stage("predict_loop"):
+            rows, err = forecast_prophet_for_series(DF, req.store, req.dept, horizon=req.horizon)
         if err or not rows:
             fig.suptitle(f"Prophet error: {err}", color="orange")
         else:
@@ -183,24 +240,28 @@ def plot(req: ForecastRequest):
             ax.fill_between(ds, lo, hi, alpha=0.2, label="CI")
 
     else:  # global_rf
-        rf, feature_cols = load_rf()
+        with prof.stage("model_load"):
+            rf, feature_cols = load_rf()
         if rf is None:
             fig.suptitle("RF not trained; call /train first.", color="orange")
         else:
-            mod, X, y, feats = build_features(DF)
-            series_mod = mod[(mod["Store"]==req.store) & (mod["Dept"]==req.dept)].copy().sort_values("Date")
+            with prof.stage("feature_build"):
+                mod, X, y, feats = build_features(DF)
+                series_mod = mod[(mod["Store"]==req.store) & (mod["Dept"]==req.dept)].copy().sort_values("Date")
             if series_mod.empty:
                 fig.suptitle("Series empty after feature prep", color="orange")
             else:
-                dates, preds = recursive_rf_forecast(series_mod, feature_cols, rf, req.horizon)
+                with prof.stage("predict_loop"):
+                    dates, preds = recursive_rf_forecast(series_mod, feature_cols, rf, req.horizon)
                 ax.plot(pd.to_datetime(dates), preds, label="Global RF", linestyle="--")
 
-    ax.set_title(f"Store {req.store} Dept {req.dept} — {req.mode} forecast")
-    ax.set_ylabel("Weekly_Sales")
-    ax.legend(); fig.tight_layout()
-    buf = io.BytesIO()
-    fig.savefig(buf, format="png", dpi=144)
-    plt.close(fig)
+    with prof.stage("render"):
+        ax.set_title(f"Store {req.store} Dept {req.dept} — {req.mode} forecast")
+        ax.set_ylabel("Weekly_Sales")
+        ax.legend(); fig.tight_layout()
+        buf = io.BytesIO()
+        fig.savefig(buf, format="png", dpi=144)
+        plt.close(fig)
     buf.seek(0)
     return StreamingResponse(buf, media_type="image/png")
 
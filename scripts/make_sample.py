@@ -4,6 +4,9 @@ import argparse, sys
 from pathlib import Path
 import pandas as pd
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from src.profiling import NULL_PROFILER, get_profiler
+
 def parse_args():
     ap = argparse.ArgumentParser(description="Create a small demo dataset (data/sample/) from full Walmart files.")
     ap.add_argument("--data-dir", default="data", help="Folder with full train.csv, features.csv, stores.csv")
@@ -12,17 +15,28 @@ def parse_args():
     ap.add_argument("--stores", type=int, nargs="*", default=None, help="Store IDs to include (optional)")
     ap.add_argument("--depts", type=int, nargs="*", default=None, help="Dept IDs to include (optional)")
     ap.add_argument("--topk", type=int, default=2, help="Auto-pick top-K (Store,Dept) by row count if no stores/depts given")
+    ap.add_argument("--profile", action="store_true", help="Write a cProfile dump and stage timeline to --profile-dir")
+    ap.add_argument("--profile-dir", default="artifacts/profiles", help="Where --profile writes its artifacts")
     return ap.parse_args()
 
 def main():
     args = parse_args()
+    profiler = get_profiler(args.profile, "make_sample")
+    with profiler:
+        make_sample(args, profiler)
+    if profiler.enabled:
+        saved = profiler.save(args.profile_dir)
+        print("Profile written to", Path(args.profile_dir) / saved["files"][0])
+
+def make_sample(args, profiler=NULL_PROFILER):
     data_dir = Path(args.data_dir)
     out_dir = Path(args.out_dir)
     out_dir.mkdir(parents=True, exist_ok=True)
 
-    train = pd.read_csv(data_dir / "train.csv", parse_dates=["Date"])
-    features = pd.read_csv(data_dir / "features.csv", parse_dates=["Date"])
-    stores = pd.read_csv(data_dir / "stores.csv")
+    with profiler.stage("data_load"):
+        train = pd.read_csv(data_dir / "train.csv", parse_dates=["Date"])
+        features = pd.read_csv(data_dir / "features.csv", parse_dates=["Date"])
+        stores = pd.read_csv(data_dir / "stores.csv")
 
     # Choose which (Store, Dept) series to include
     if args.stores and args.depts:
@@ -50,9 +64,10 @@ def main():
     f = f.sort_values(["Store", "Date"])
     s = s.sort_values(["Store"])
 
-    (out_dir / "train.csv").write_text(t.to_csv(index=False))
-    (out_dir / "features.csv").write_text(f.to_csv(index=False))
-    (out_dir / "stores.csv").write_text(s.to_csv(index=False))
+    with profiler.stage("write"):
+        (out_dir / "train.csv").write_text(t.to_csv(index=False))
+        (out_dir / "features.csv").write_text(f.to_csv(index=False))
+        (out_dir / "stores.csv").write_text(s.to_csv(index=False))
 
     print(f"Sample written to: {out_dir}")
     print(f"  train:    {t.shape}")
@@ -1,5 +1,5 @@
 from __future__ import annotations
-import time, numpy as np, pandas as pd
+import json, time, numpy as np, pandas as pd
 from pathlib import Path
 from sklearn.metrics import mean_absolute_error
 
@@ -9,13 +9,18 @@ from .baselines import evaluate_naives, make_holdout_masks, wmae
 from .models_rf import train_rf, load_model
 from .models_sarimax import forecast_sarimax_for_series
 from .models_prophet import forecast_prophet_for_series
+from .profiling import NULL_PROFILER
 
-def leaderboard(data_dir: str|Path, artifacts_dir: str|Path, holdout_weeks=8, topN_series=10, use_trained_rf=True):
+def leaderboard(data_dir: str|Path, artifacts_dir: str|Path, holdout_weeks=8, topN_series=10, use_trained_rf=True,
+                profiler=None):
+    prof = profiler or NULL_PROFILER
     data_dir, artifacts_dir = Path(data_dir), Path(artifacts_dir)
-    df = load_merge(data_dir)
+    with prof.stage("data_load"):
+        df = load_merge(data_dir)
 
     # Baselines across all rows
-    base = evaluate_naives(df, holdout_weeks=holdout_weeks)
+    with prof.stage("baselines"):
+        base = evaluate_naives(df, holdout_weeks=holdout_weeks)
     rows = []
     for _, r in base.iterrows():
         rows.append({
@@ -28,7 +33,8 @@ def leaderboard(data_dir: str|Path, artifacts_dir: str|Path, holdout_weeks=8, to
         })
 
     # Build features and split
-    mod, X, y, feats = build_features(df)
+    with prof.stage("feature_build"):
+        mod, X, y, feats = build_features(df)
     cutoff, tr_mask, te_mask = make_holdout_masks(mod, holdout_weeks=holdout_weeks, date_col="Date")
     X_tr, y_tr = X[tr_mask], y[tr_mask]
     X_te, y_te = X[te_mask], y[te_mask]
@@ -36,28 +42,38 @@ def leaderboard(data_dir: str|Path, artifacts_dir: str|Path, holdout_weeks=8, to
     # RF: load if available, else train quickly
     rf = None
     feat_list = feats
-    try:
-        from joblib import load
-        rf = load(artifacts_dir / "rf_model.joblib")
-        feat_list = (artifacts_dir / "rf_features.txt").read_text(encoding="utf-8").splitlines()
-        X_te_aligned = X_te.reindex(columns=feat_list, fill_value=0)
-    except Exception:
+    model_name = "GlobalRF"
+    with prof.stage("model_load"):
+        try:
+            from joblib import load
+            rf = load(artifacts_dir / "rf_model.joblib")
+            feat_list = (artifacts_dir / "rf_features.txt").read_text(encoding="utf-8").splitlines()
+            X_te_aligned = X_te.reindex(columns=feat_list, fill_value=0)
+            meta_path = artifacts_dir / "model_meta.json"
+            if meta_path.exists():
+                backend = json.loads(meta_path.read_text(encoding="utf-8")).get("backend", "rf")
+                model_name = "GlobalHGB" if backend == "hgb" else "GlobalRF"
+        except Exception:
+            rf = None
+    if rf is None:
         # Train inline
-        from .models_rf import train_rf
-        rf, _ = train_rf(X_tr, y_tr, n_splits=5, random_state=42)
-        X_te_aligned = X_te
+        with prof.stage("fit"):
+            from .models_rf import train_rf
+            rf, _ = train_rf(X_tr, y_tr, n_splits=5, random_state=42)
+            X_te_aligned = X_te
 
-    yhat_te = rf.predict(X_te_aligned)
+    with prof.stage("predict"):
+        yhat_te = rf.predict(X_te_aligned)
     w = (mod[tr_mask].groupby(["Store","Dept"])['Weekly_Sales'].mean().rename('w').reset_index())
     w_te = mod.loc[te_mask, ["Store","Dept"]].merge(w, on=["Store","Dept"], how="left")["w"].fillna(y_tr.mean())
 
     rows.append({
-        "Model": "GlobalRF",
+        "Model": model_name,
         "Scope": "All rows (test)",
         "Rows": int(len(y_te)),
         "MAE": float(mean_absolute_error(y_te, yhat_te)),
         "WMAE": float(wmae(y_te.values, yhat_te, w_te.values)),
-        "Notes": "RandomForestRegressor"
+        "Notes": type(rf).__name__
     })
 
     # Classical models on Top-N series (by average sales)
@@ -76,7 +92,8 @@ def leaderboard(data_dir: str|Path, artifacts_dir: str|Path, holdout_weeks=8, to
         if te.empty: continue
 
         # SARIMAX
-        yhat, err = forecast_sarimax_for_series(df, store, dept, horizon=len(te))
+        with prof.stage(f"sarimax {store}/{dept}"):
+            yhat, err = forecast_sarimax_for_series(df, store, dept, horizon=len(te))
         if not err and yhat is not None and len(yhat)==len(te):
             rows.append({
                 "Model": "SARIMAX(1,1,1)x(1,1,1,52)",
@@ -90,7 +107,8 @@ def leaderboard(data_dir: str|Path, artifacts_dir: str|Path, holdout_weeks=8, to
         # Prophet
         rows_p = None
         try:
-            rows_p, err_p = forecast_prophet_for_series(df, store, dept, horizon=len(te))
+            with prof.stage(f"prophet {store}/{dept}"):
+                rows_p, err_p = forecast_prophet_for_series(df, store, dept, horizon=len(te))
         except Exception:
             err_p = "prophet error"
         if rows_p and (not err_p):
@@ -104,8 +122,9 @@ def leaderboard(data_dir: str|Path, artifacts_dir: str|Path, holdout_weeks=8, to
                 "Notes": "per-series with intervals"
             })
 
-    lb = pd.DataFrame(rows).sort_values(["Scope","WMAE","MAE"]).reset_index(drop=True)
-    artifacts_dir.mkdir(parents=True, exist_ok=True)
-    out = artifacts_dir / "leaderboard.csv"
-    lb.to_csv(out, index=False)
+    with prof.stage("render"):
+        lb = pd.DataFrame(rows).sort_values(["Scope","WMAE","MAE"]).reset_index(drop=True)
+        artifacts_dir.mkdir(parents=True, exist_ok=True)
+        out = artifacts_dir / "leaderboard.csv"
+        lb.to_csv(out, index=False)
     return out, lb
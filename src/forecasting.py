@@ -15,7 +15,7 @@ def recursive_rf_forecast(series_mod: pd.DataFrame, feature_cols, rf_model, hori
         - calendar/type/price/markdown features
     feature_cols : list[str]
         The exact feature column order RF expects.
-    rf_model : fitted RandomForestRegressor
+    rf_model : fitted regressor (RandomForestRegressor or HistGradientBoostingRegressor)
     horizon : int
         Number of weeks to forecast forward.
 
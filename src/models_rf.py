@@ -23,6 +23,68 @@ def train_rf(X_tr: pd.DataFrame, y_tr: pd.Series, n_splits=5, random_state=42):
     rf.fit(X_tr, y_tr)
     return rf, float(np.mean(cv_mae))
 
+def train_hgb(X_tr: pd.DataFrame, y_tr: pd.Series, dates: pd.Series, n_splits=5, random_state=42, max_iter=1000,
+              learning_rate=0.1, patience=20, chunk=10):
+    """Histogram gradient boosting with early stopping on the last time fold.
+
+    ``dates`` gives each row's week; the distinct weeks are split with TimeSeriesSplit and
+    the last block of weeks is held out, so the fold measures forecasting into the future
+    rather than across series (rows are ordered by Store/Dept, not Date). The fold model is grown ``chunk`` iterations at a time (warm start) and scored on the
+    fold's validation rows after each chunk; growth stops once ``patience`` iterations pass
+    without improvement, and the best iteration count is used for the final full fit.
+    The returned score is that early-stopping fold's MAE, not a cross-validated mean.
+    """
+    from sklearn.ensemble import HistGradientBoostingRegressor
+    if dates is None:
+        raise ValueError("train_hgb needs the row dates to hold out the latest weeks")
+    dates = pd.to_datetime(pd.Series(dates)).to_numpy()
+    weeks = np.unique(dates)
+    _, va_w = list(TimeSeriesSplit(n_splits=n_splits).split(weeks))[-1]
+    va_mask = dates >= weeks[va_w[0]]
+    tr_idx, va_idx = np.flatnonzero(~va_mask), np.flatnonzero(va_mask)
+    params = dict(learning_rate=learning_rate, max_leaf_nodes=63, min_samples_leaf=20,
+                  l2_regularization=1.0, early_stopping=False, random_state=random_state)
+    hgb = HistGradientBoostingRegressor(max_iter=0, warm_start=True, **params)
+    X_fit, y_fit = X_tr.iloc[tr_idx], y_tr.iloc[tr_idx]
+    X_va, y_va = X_tr.iloc[va_idx], y_tr.iloc[va_idx].to_numpy()
+    best_iter, best_mae = 0, np.inf
+    while hgb.max_iter < max_iter:
+        hgb.set_params(max_iter=min(max_iter, hgb.max_iter + chunk))
+        hgb.fit(X_fit, y_fit)
+        mae = mean_absolute_error(y_va, hgb.predict(X_va))
+        if mae < best_mae:
+            best_iter, best_mae = hgb.n_iter_, mae
+        elif hgb.n_iter_ - best_iter >= patience:
+            break
+    model = HistGradientBoostingRegressor(max_iter=best_iter, **params)
+    model.fit(X_tr, y_tr)
+    return model, float(best_mae)
+
+def refresh_rf(rf: RandomForestRegressor, X_recent: pd.DataFrame, y_recent: pd.Series, n_new=50, max_trees=400,
+               random_state=42):
+    """Warm-start ``n_new`` trees on a recent window and drop the oldest so at most ``max_trees`` remain."""
+    if not 0 < n_new < max_trees:
+        raise ValueError(f"n_new must be in [1, {max_trees - 1}] so some full-history trees survive, got {n_new}")
+    rf.set_params(warm_start=True, n_estimators=len(rf.estimators_) + n_new, random_state=random_state)
+    rf.fit(X_recent, y_recent)
+    rf.estimators_ = rf.estimators_[-max_trees:]
+    rf.set_params(warm_start=False, n_estimators=len(rf.estimators_))
+    return rf
+
+BACKENDS = ("rf", "hgb")
+
+def train_model(X_tr: pd.DataFrame, y_tr: pd.Series, backend="rf", n_splits=5, random_state=42, dates=None):
+    """Dispatch to the training routine for ``backend``; returns ``(model, score)``.
+
+    ``score`` is the mean CV MAE for ``rf`` and the early-stopping fold MAE for ``hgb``.
+    ``dates`` (row weeks aligned with ``X_tr``) is required by ``hgb``.
+    """
+    if backend == "rf":
+        return train_rf(X_tr, y_tr, n_splits=n_splits, random_state=random_state)
+    if backend == "hgb":
+        return train_hgb(X_tr, y_tr, dates, n_splits=n_splits, random_state=random_state)
+    raise ValueError(f"Unknown model backend {backend!r}; expected one of {BACKENDS}")
+
 def save_model(model, path: str):
     dump(model, path)
 
@@ -32,19 +94,125 @@ def load_model(path: str):
 from sklearn.model_selection import RandomizedSearchCV
 from scipy.stats import randint
 
+RF_PARAM_DIST = {
+    "n_estimators": randint(300, 900),
+    "max_depth": randint(8, 32),
+    "min_samples_leaf": randint(1, 8),
+    "max_features": ["sqrt", "log2", None]
+}
+
 def tune_rf(X_tr: pd.DataFrame, y_tr: pd.Series, n_splits=5, random_state=42, n_iter=20):
     """Randomized hyperparameter search with time-aware CV."""
     base = RandomForestRegressor(n_estimators=400, min_samples_leaf=2, n_jobs=-1, random_state=random_state)
-    param_dist = {
-        "n_estimators": randint(300, 900),
-        "max_depth": randint(8, 32),
-        "min_samples_leaf": randint(1, 8),
-        "max_features": ["sqrt", "log2", None]
-    }
     tscv = TimeSeriesSplit(n_splits=n_splits)
     rs = RandomizedSearchCV(
-        base, param_distributions=param_dist, n_iter=n_iter, cv=tscv, scoring="neg_mean_absolute_error",
+        base, param_distributions=RF_PARAM_DIST, n_iter=n_iter, cv=tscv, scoring="neg_mean_absolute_error",
         n_jobs=-1, random_state=random_state, verbose=1
     )
     rs.fit(X_tr, y_tr)
     return rs.best_estimator_, rs.best_params_
+
+import json, math, hashlib
+from pathlib import Path
+from sklearn.model_selection import ParameterSampler
+
+def _fold_arrays(X_tr: pd.DataFrame, y_tr: pd.Series, n_splits=5, random_state=42):
+    """Materialize every TimeSeriesSplit fold once as float32 arrays plus a fixed row order for subsampling."""
+    Xa = X_tr.to_numpy(dtype=np.float32)
+    ya = y_tr.to_numpy(dtype=np.float64)
+    rng = np.random.RandomState(random_state)
+    folds = []
+    for tr_idx, va_idx in TimeSeriesSplit(n_splits=n_splits).split(Xa):
+        folds.append({
+            "X_tr": Xa[tr_idx], "y_tr": ya[tr_idx],
+            "X_va": Xa[va_idx], "y_va": ya[va_idx],
+            "order": rng.permutation(len(tr_idx)),
+        })
+    return folds
+
+def _frame_sha1(obj) -> str:
+    return hashlib.sha1(pd.util.hash_pandas_object(obj, index=False).to_numpy().tobytes()).hexdigest()
+
+def _search_signature(X_tr: pd.DataFrame, y_tr: pd.Series, n_splits, random_state, n_candidates, factor,
+                      min_trees, min_rows):
+    return {"rows": int(len(y_tr)), "cols": [str(c) for c in X_tr.columns], "X_sha1": _frame_sha1(X_tr),
+            "y_sha1": _frame_sha1(y_tr), "n_splits": int(n_splits), "random_state": int(random_state),
+            "n_candidates": int(n_candidates), "factor": int(factor), "min_trees": int(min_trees),
+            "min_rows": int(min_rows)}
+
+def _write_checkpoint(path: Path, state: dict):
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_text(json.dumps(state, indent=2), encoding="utf-8")
+    tmp.replace(path)
+
+def tune_rf_halving(X_tr: pd.DataFrame, y_tr: pd.Series, n_splits=5, random_state=42, n_iter=20,
+                    factor=3, min_trees=25, min_rows=2000, checkpoint_path=None, verbose=1):
+    """Successive-halving search over RF hyperparameters with time-aware CV.
+
+    Each rung scales both the tree count and the training rows of every fold by
+    ``factor ** (rung - last_rung)``; only the best ``1/factor`` candidates advance. The
+    last rung keeps at least ``factor`` candidates so the full-resource fits still decide
+    between configurations.
+    Fold arrays are built once and shared by all candidates. When ``checkpoint_path``
+    is given, every finished (rung, candidate) score is persisted there and reused on
+    the next run with the same data and settings.
+    """
+    if factor < 2:
+        raise ValueError(f"factor must be >= 2, got {factor}")
+    candidates = []
+    for p in ParameterSampler(RF_PARAM_DIST, n_iter=n_iter, random_state=random_state):
+        candidates.append({k: (v.item() if isinstance(v, np.generic) else v) for k, v in p.items()})
+    n_rungs, n_left = 1, len(candidates)
+    while math.ceil(n_left / factor) >= factor:
+        n_left = math.ceil(n_left / factor)
+        n_rungs += 1
+
+    signature = _search_signature(X_tr, y_tr, n_splits, random_state, len(candidates), factor, min_trees, min_rows)
+    state = {"signature": signature, "candidates": candidates, "scores": {}}
+    if checkpoint_path is not None:
+        checkpoint_path = Path(checkpoint_path)
+        if checkpoint_path.exists():
+            try:
+                prev = json.loads(checkpoint_path.read_text(encoding="utf-8"))
+            except Exception as e:
+                prev = None
+                print(f"Ignoring unreadable checkpoint {checkpoint_path}: {e}; starting fresh")
+            if prev is not None:
+                if prev.get("signature") == signature and prev.get("candidates") == candidates:
+                    state["scores"] = prev.get("scores", {})
+                    if verbose:
+                        print(f"Resuming halving search: {len(state['scores'])} evaluations restored")
+                elif verbose:
+                    print(f"Checkpoint {checkpoint_path} is for different data, settings or candidates; starting fresh")
+
+    folds = _fold_arrays(X_tr, y_tr, n_splits=n_splits, random_state=random_state)
+    survivors = list(range(len(candidates)))
+    for rung in range(n_rungs):
+        frac = float(factor) ** (rung - (n_rungs - 1))
+        scores = {}
+        for i in survivors:
+            key = f"{rung}:{i}"
+            if key not in state["scores"]:
+                params = dict(candidates[i])
+                params["n_estimators"] = max(min_trees, int(round(params["n_estimators"] * frac)))
+                rf = RandomForestRegressor(n_jobs=-1, random_state=random_state, **params)
+                fold_mae = []
+                for f in folds:
+                    n = len(f["order"])
+                    k = min(n, max(min_rows, int(round(n * frac))))
+                    rows = np.sort(f["order"][:k])
+                    rf.fit(f["X_tr"][rows], f["y_tr"][rows])
+                    fold_mae.append(mean_absolute_error(f["y_va"], rf.predict(f["X_va"])))
+                state["scores"][key] = float(np.mean(fold_mae))
+                if checkpoint_path is not None:
+                    _write_checkpoint(checkpoint_path, state)
+            scores[i] = state["scores"][key]
+        keep = max(1, int(math.ceil(len(survivors) / factor))) if rung < n_rungs - 1 else 1
+        survivors = sorted(survivors, key=lambda i: scores[i])[:keep]
+        if verbose:
+            print(f"Rung {rung}: {len(scores)} candidates at {frac:.0%} resource, best CV MAE {scores[survivors[0]]:.2f}")
+
+    best_params = dict(candidates[survivors[0]])
+    best = RandomForestRegressor(n_jobs=-1, random_state=random_state, **best_params)
+    best.fit(X_tr, y_tr)
+    return best, best_params
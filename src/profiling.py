@@ -0,0 +1,101 @@
+from __future__ import annotations
+import cProfile, io, json, pstats, time, uuid
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+
+class Profiler:
+    """cProfile capture plus a named stage timeline for one request or CLI run.
+
+    Use as a context manager around the work and wrap each phase in ``stage(name)``.
+    ``save`` writes ``<id>.prof`` (loadable with pstats/snakeviz) and ``<id>.json``, then
+    prunes the directory to the newest ``keep`` profiles.
+    """
+    enabled = True
+
+    def __init__(self, name: str):
+        self.name = name
+        self.id = f"{name}-{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+        self.stages = []
+        self._prof = cProfile.Profile()
+        self._active = False
+        self._t0 = None
+        self.total_s = None
+
+    def __enter__(self):
+        self._t0 = time.perf_counter()
+        try:
+            self._prof.enable()
+            self._active = True
+        except ValueError:
+            # Another profiler already owns the interpreter hook (e.g. a concurrent request); keep the timeline only.
+            self._active = False
+        return self
+
+    def __exit__(self, *exc):
+        if self._active:
+            self._prof.disable()
+        self.total_s = time.perf_counter() - self._t0
+        return False
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            self.stages.append({"stage": name, "start_s": round(start - self._t0, 6), "duration_s": round(end - start, 6)})
+
+    def top_functions(self, n=25):
+        if not self._active:
+            return ""
+        buf = io.StringIO()
+        pstats.Stats(self._prof, stream=buf).sort_stats("cumulative").print_stats(n)
+        return buf.getvalue()
+
+    def report(self) -> dict:
+        return {"id": self.id, "name": self.name, "total_s": round(self.total_s or 0.0, 6), "cprofile": self._active,
+                "stages": self.stages}
+
+    def save(self, out_dir: str|Path, keep=50) -> dict:
+        out_dir = Path(out_dir)
+        out_dir.mkdir(parents=True, exist_ok=True)
+        files = [f"{self.id}.json"]
+        if self._active:
+            self._prof.dump_stats(str(out_dir / f"{self.id}.prof"))
+            files.append(f"{self.id}.prof")
+        rep = self.report()
+        rep["top_functions"] = self.top_functions()
+        (out_dir / f"{self.id}.json").write_text(json.dumps(rep, indent=2), encoding="utf-8")
+        prune_profiles(out_dir, keep)
+        return {**self.report(), "files": files}
+
+def prune_profiles(out_dir: str|Path, keep: int):
+    """Delete all but the newest ``keep`` profiles (``.json`` + ``.prof`` pairs) in ``out_dir``; ``keep <= 0`` keeps all."""
+    if keep <= 0:
+        return
+    runs = {}
+    for p in Path(out_dir).glob("*.json"):
+        runs[p.stem] = p.stat().st_mtime
+    for stem in sorted(runs, key=runs.get)[:-keep]:
+        for suffix in (".json", ".prof"):
+            (Path(out_dir) / f"{stem}{suffix}").unlink(missing_ok=True)
+
+class _NullProfiler:
+    """Stand-in used when profiling is off: no cProfile hook and no timing calls."""
+    enabled = False
+    _ctx = nullcontext()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def stage(self, name: str):
+        return self._ctx
+
+NULL_PROFILER = _NullProfiler()
+
+def get_profiler(enabled: bool, name: str):
+    return Profiler(name) if enabled else NULL_PROFILER
@@ -1,48 +1,159 @@
 from __future__ import annotations
-import argparse, json, numpy as np, pandas as pd
+import argparse, json, os, re, shutil, numpy as np, pandas as pd
 from pathlib import Path
 from .data import load_merge
 from .features import build_features
 from .baselines import make_holdout_masks, wmae, evaluate_naives
-from .models_rf import train_rf, save_model, tune_rf
+from .profiling import NULL_PROFILER, get_profiler
+from .models_rf import BACKENDS, train_model, save_model, load_model, tune_rf, tune_rf_halving, refresh_rf
 
-def main(data_dir: str, artifacts_dir: str, holdout_weeks=8, tune=False, n_iter=20, cv_splits=5, random_state=42):
+def _halving_factor(value: str) -> int:
+    factor = int(value)
+    if factor < 2:
+        raise argparse.ArgumentTypeError("halving factor must be >= 2")
+    return factor
+
+def _positive_int(value: str) -> int:
+    n = int(value)
+    if n < 1:
+        raise argparse.ArgumentTypeError("must be >= 1")
+    return n
+
+def _load_refreshable(artifacts_dir: Path, feature_cols, meta: dict, full_every: int, cutoff):
+    """Return the saved RF if it can be warm-started in place, else ``(None, reason)``."""
+    model_path, feats_path = artifacts_dir / "rf_model.joblib", artifacts_dir / "rf_features.txt"
+    if not model_path.exists() or not feats_path.exists():
+        return None, "no saved model"
+    if meta.get("backend", "rf") != "rf":
+        return None, f"saved model uses the {meta['backend']} backend"
+    if "cutoff" not in meta:
+        return None, "saved model has no recorded training cutoff"
+    if pd.Timestamp(meta["cutoff"]) > cutoff:
+        # Old trees saw rows that are now in the holdout; refreshing would leak them into the scores.
+        return None, f"holdout cutoff moved back from {meta['cutoff']} to {cutoff.date()}"
+    if full_every and int(meta.get("refreshes_since_full", 0)) >= full_every:
+        return None, f"{full_every} refreshes since the last full retrain"
+    if feats_path.read_text(encoding="utf-8").splitlines() != list(feature_cols):
+        return None, "feature columns changed"
+    return load_model(model_path), None
+
+def _publish_model(versioned: Path, current: Path):
+    """Point ``current`` at ``versioned`` via a hard link (atomic replace), copying only if links are unsupported."""
+    tmp = current.with_name(current.name + ".tmp")
+    tmp.unlink(missing_ok=True)
+    try:
+        os.link(versioned, tmp)
+    except OSError:
+        shutil.copyfile(versioned, tmp)
+    os.replace(tmp, current)
+
+def _prune_versions(artifacts_dir: Path, keep: int):
+    """Delete all but the newest ``keep`` ``rf_model.v<N>.joblib`` files (``keep <= 0`` keeps everything)."""
+    if keep <= 0:
+        return
+    versions = []
+    for p in artifacts_dir.glob("rf_model.v*.joblib"):
+        m = re.fullmatch(r"rf_model\.v(\d+)\.joblib", p.name)
+        if m:
+            versions.append((int(m.group(1)), p))
+    for _, p in sorted(versions)[:-keep]:
+        p.unlink()
+
+def main(data_dir: str, artifacts_dir: str, holdout_weeks=8, tune=False, n_iter=20, cv_splits=5, random_state=42,
+         tune_method="random", halving_factor=3, backend="rf", refresh=False, refresh_trees=50, refresh_weeks=52,
+         full_every=0, keep_versions=2, profiler=None):
+    prof = profiler or NULL_PROFILER
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown model backend {backend!r}; expected one of {BACKENDS}")
+    if tune and backend != "rf":
+        raise ValueError("Hyperparameter tuning is only available for the rf backend")
+    if refresh and refresh_trees < 1:
+        raise ValueError(f"refresh_trees must be >= 1, got {refresh_trees}")
     data_dir = Path(data_dir)
     artifacts_dir = Path(artifacts_dir)
     artifacts_dir.mkdir(parents=True, exist_ok=True)
 
-    df = load_merge(data_dir)
-    base_df = evaluate_naives(df, holdout_weeks=holdout_weeks)
-    base_df.to_csv(artifacts_dir / "baselines.csv", index=False)
+    with prof.stage("data_load"):
+        df = load_merge(data_dir)
+    with prof.stage("baselines"):
+        base_df = evaluate_naives(df, holdout_weeks=holdout_weeks)
+        base_df.to_csv(artifacts_dir / "baselines.csv", index=False)
 
-    mod, X, y, feature_cols = build_features(df)
+    with prof.stage("feature_build"):
+        mod, X, y, feature_cols = build_features(df)
     cutoff, tr_mask, te_mask = make_holdout_masks(mod, holdout_weeks=holdout_weeks, date_col="Date")
     X_tr, y_tr = X[tr_mask], y[tr_mask]
     X_te, y_te = X[te_mask], y[te_mask]
 
     from sklearn.metrics import mean_absolute_error
 
-    if tune:
-        rf, best_params = tune_rf(X_tr, y_tr, n_splits=cv_splits, random_state=random_state, n_iter=n_iter)
-        (artifacts_dir / "rf_best_params.json").write_text(json.dumps(best_params, indent=2), encoding="utf-8")
-    else:
-        rf, cv_mae = train_rf(X_tr, y_tr, n_splits=cv_splits, random_state=random_state)
+    meta_path = artifacts_dir / "model_meta.json"
+    prev_meta = json.loads(meta_path.read_text(encoding="utf-8")) if meta_path.exists() else {}
+    version = int(prev_meta.get("version", 0)) + 1
+
+    prev_rf = None
+    if refresh:
+        if backend != "rf":
+            reason = f"refresh is only supported for the rf backend, not {backend}"
+        elif tune:
+            reason = "tuning always retrains from scratch"
+        else:
+            with prof.stage("model_load"):
+                prev_rf, reason = _load_refreshable(artifacts_dir, feature_cols, prev_meta, full_every, cutoff)
+        if prev_rf is not None and refresh_trees >= len(prev_rf.estimators_):
+            raise ValueError(f"refresh_trees ({refresh_trees}) must be smaller than the saved ensemble "
+                             f"({len(prev_rf.estimators_)} trees), or every full-history tree is dropped")
+        if prev_rf is None:
+            print(f"Full retrain instead of refresh: {reason}")
+    refreshed = prev_rf is not None
+
+    cv_mae = es_val_mae = float(np.nan)
+    with prof.stage("fit"):
+        if refreshed:
+            recent = tr_mask & (mod["Date"] > cutoff - pd.Timedelta(weeks=refresh_weeks))
+            rf = refresh_rf(prev_rf, X[recent], y[recent], n_new=refresh_trees, max_trees=len(prev_rf.estimators_),
+                            random_state=random_state + version)
+        elif tune and tune_method == "halving":
+            rf, best_params = tune_rf_halving(X_tr, y_tr, n_splits=cv_splits, random_state=random_state, n_iter=n_iter,
+                                              factor=halving_factor, checkpoint_path=artifacts_dir / "rf_halving_state.json")
+            (artifacts_dir / "rf_best_params.json").write_text(json.dumps(best_params, indent=2), encoding="utf-8")
+        elif tune:
+            rf, best_params = tune_rf(X_tr, y_tr, n_splits=cv_splits, random_state=random_state, n_iter=n_iter)
+            (artifacts_dir / "rf_best_params.json").write_text(json.dumps(best_params, indent=2), encoding="utf-8")
+        else:
+            rf, score = train_model(X_tr, y_tr, backend=backend, n_splits=cv_splits, random_state=random_state,
+                                    dates=mod.loc[tr_mask, "Date"])
+            if backend == "hgb":
+                es_val_mae = score
+            else:
+                cv_mae = score
 
-    yhat_te = rf.predict(X_te)
+    with prof.stage("predict"):
+        yhat_te = rf.predict(X_te)
 
     w = (mod[tr_mask].groupby(["Store","Dept"])['Weekly_Sales'].mean().rename('w').reset_index())
     w_te = mod.loc[te_mask, ["Store","Dept"]].merge(w, on=["Store","Dept"], how="left")["w"].fillna(y_tr.mean())
 
     scores = {
-        "cv_mae": float(np.nan),  # cv_mae computed inside train_rf; optional to store separately
+        "backend": backend,
+        "cv_mae": float(cv_mae),  # RF time-series CV mean; NaN when tuning or refreshing
+        "es_val_mae": float(es_val_mae),  # hgb early-stopping fold MAE (biased low, not comparable to cv_mae)
         "holdout_mae": float(mean_absolute_error(y_te, yhat_te)),
         "holdout_wmae": float(wmae(y_te.values, yhat_te, w_te.values))
     }
     pd.DataFrame([scores]).to_csv(artifacts_dir / "rf_scores.csv", index=False)
 
-    from joblib import dump
-    dump(rf, artifacts_dir / "rf_model.joblib")
-    pd.Series(feature_cols).to_csv(artifacts_dir / "rf_features.txt", index=False, header=False)
+    with prof.stage("save"):
+        versioned = artifacts_dir / f"rf_model.v{version}.joblib"
+        versioned.unlink(missing_ok=True)  # never write through a hard link to the current model
+        save_model(rf, versioned)
+        _publish_model(versioned, artifacts_dir / "rf_model.joblib")
+        _prune_versions(artifacts_dir, keep_versions)
+        pd.Series(feature_cols).to_csv(artifacts_dir / "rf_features.txt", index=False, header=False)
+        meta = {"backend": backend, "estimator": type(rf).__name__, "cutoff": str(cutoff.date()), "version": version,
+                "mode": "refresh" if refreshed else "full",
+                "refreshes_since_full": int(prev_meta.get("refreshes_since_full", 0)) + 1 if refreshed else 0}
+        (artifacts_dir / "model_meta.json").write_text(json.dumps(meta, indent=2), encoding="utf-8")
     print("Saved model and metrics to", artifacts_dir)
 
 if __name__ == "__main__":
@@ -50,9 +161,27 @@ if __name__ == "__main__":
     ap.add_argument("--data-dir", default="data", type=str)
     ap.add_argument("--artifacts-dir", default="artifacts", type=str)
     ap.add_argument("--holdout-weeks", default=8, type=int)
+    ap.add_argument("--backend", default="rf", choices=list(BACKENDS), help="Global model: random forest or histogram gradient boosting")
     ap.add_argument("--tune", action="store_true", help="RandomizedSearchCV on RF with time-aware CV")
     ap.add_argument("--n-iter", default=20, type=int, help="Randomized search iterations")
+    ap.add_argument("--tune-method", default="random", choices=["random", "halving"], help="Search strategy used with --tune")
+    ap.add_argument("--halving-factor", default=3, type=_halving_factor, help="Candidates kept per rung = 1/factor (halving search)")
+    ap.add_argument("--refresh", action="store_true", help="Warm-start new RF trees on recent weeks instead of a full retrain")
+    ap.add_argument("--refresh-trees", default=50, type=_positive_int, help="Trees added per refresh (oldest are dropped)")
+    ap.add_argument("--refresh-weeks", default=52, type=int, help="Recent training weeks the new trees are fit on")
+    ap.add_argument("--full-every", default=0, type=int, help="Force a full retrain after this many refreshes (0 = never)")
+    ap.add_argument("--keep-versions", default=2, type=int, help="Versioned rf_model.v<N>.joblib files to retain (0 = all)")
+    ap.add_argument("--profile", action="store_true", help="Write a cProfile dump and stage timeline to <artifacts-dir>/profiles")
     ap.add_argument("--cv-splits", default=5, type=int, help="TimeSeriesSplit folds")
     ap.add_argument("--random-state", default=42, type=int)
     args = ap.parse_args()
-    main(args.data_dir, args.artifacts_dir, holdout_weeks=args.holdout_weeks, tune=args.tune, n_iter=args.n_iter, cv_splits=args.cv_splits, random_state=args.random_state)
+    profiler = get_profiler(args.profile, "train")
+    with profiler:
+        main(args.data_dir, args.artifacts_dir, holdout_weeks=args.holdout_weeks, tune=args.tune, n_iter=args.n_iter, cv_splits=args.cv_splits, random_state=args.random_state,
+             tune_method=args.tune_method, halving_factor=args.halving_factor, backend=args.backend,
+             refresh=args.refresh, refresh_trees=args.refresh_trees, refresh_weeks=args.refresh_weeks, full_every=args.full_every,
+             keep_versions=args.keep_versions,
+             profiler=profiler)
+    if profiler.enabled:
+        saved = profiler.save(Path(args.artifacts_dir) / "profiles")
+        print("Profile written to", Path(args.artifacts_dir) / "profiles" / saved["files"][0])